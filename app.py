@@ -1,238 +1,273 @@
-import streamlit as st
-import pandas as pd
-from io import BytesIO
-
-# --------------------------------------------------
-# Configuração da página
-# --------------------------------------------------
-st.set_page_config(
-    page_title="Validador de Credores – PCASP",
-    layout="wide"
-)
-
-st.title("📊 Validação de Credores – Grupos 7 e 8")
-st.caption(
-    "Comparação automática entre CONTROLES DEVEDORES (Grupo 7) "
-    "e CONTROLES CREDORES (Grupo 8)."
-)
-
-# --------------------------------------------------
-# Upload
-# --------------------------------------------------
-uploaded_file = st.file_uploader(
-    "📤 Arraste e solte o arquivo CSV aqui ou clique para selecionar",
-    type=["csv"]
-)
-
-if not uploaded_file:
-    st.stop()
-
-# --------------------------------------------------
-# Leitura do CSV (TUDO como texto)
-# --------------------------------------------------
-try:
-    df = pd.read_csv(
-        uploaded_file,
-        sep=";",
-        encoding="utf-8",
-        engine="python",
-        dtype=str
-    )
-except UnicodeDecodeError:
-    df = pd.read_csv(
-        uploaded_file,
-        sep=";",
-        encoding="latin1",
-        engine="python",
-        dtype=str
-    )
-
-df.columns = df.columns.str.strip().str.lower()
-
-# --------------------------------------------------
-# Mapeamento fixo de colunas
-# --------------------------------------------------
-COL_MASCARA = "máscara"
-COL_DESC = "descrição"
-COL_SALDO = "saldo atual"        # coluna H
-COL_TIPO = "tipo saldo.1" if "tipo saldo.1" in df.columns else "tipo saldo"  # coluna I
-
-# --------------------------------------------------
-# Função segura para converter valores monetários
-# --------------------------------------------------
-def converter_valor(valor):
-    if valor is None:
-        return 0.0
-
-    valor = str(valor).strip()
-
-    if valor == "":
-        return 0.0
-
-    # remove milhar
-    valor = valor.replace(".", "")
-    # ajusta decimal
-    valor = valor.replace(",", ".")
-
-    try:
-        return float(valor)
-    except ValueError:
-        return 0.0
-
-# --------------------------------------------------
-# Reconstrução da máscara completa
-# --------------------------------------------------
-ultima = None
-mascaras = []
-
-for _, row in df.iterrows():
-    val = row.get(COL_MASCARA)
-    if pd.notna(val) and str(val).strip() != "":
-        ultima = str(val).strip()
-    mascaras.append(ultima)
-
-df["mascara_completa"] = mascaras
-
-# --------------------------------------------------
-# Identificação do grupo (7 ou 8)
-# --------------------------------------------------
-df["grupo"] = df["mascara_completa"].str.extract(r"^([78])")
-df = df[df["grupo"].isin(["7", "8"])]
-
-# --------------------------------------------------
-# Normalização da máscara
-# - remove 7 ou 8
-# - mantém até 5 níveis
-# --------------------------------------------------
-def normalizar_mascara(m):
-    if not isinstance(m, str):
-        return ""
-    partes = m.split(".")
-    partes = partes[1:]  # remove grupo
-    return ".".join(partes[:5])
-
-df["mascara_normalizada"] = df["mascara_completa"].apply(normalizar_mascara)
-
-# --------------------------------------------------
-# Conversão correta do saldo atual
-# --------------------------------------------------
-df["saldo_num"] = df[COL_SALDO].apply(converter_valor)
-
-# --------------------------------------------------
-# Regra de valor por grupo
-# --------------------------------------------------
-def calcular_valor(row):
-    tipo = row.get(COL_TIPO)
-
-    if not isinstance(tipo, str):
-        return 0.0
-
-    tipo = tipo.strip().upper()
-
-    # Grupo 7 → somente D
-    if row["grupo"] == "7" and tipo.startswith("D"):
-        return row["saldo_num"]
-
-    # Grupo 8 → somente C
-    if row["grupo"] == "8" and tipo.startswith("C"):
-        return row["saldo_num"]
-
-    return 0.0
-
-df["valor"] = df.apply(calcular_valor, axis=1)
-
-# --------------------------------------------------
-# Apenas credores com CPF/CNPJ
-# --------------------------------------------------
-df = df[df[COL_DESC].str.contains(r"\d{11,14}", na=False)]
-
-# --------------------------------------------------
-# Agrupamento
-# --------------------------------------------------
-resumo = (
-    df.groupby(
-        ["mascara_normalizada", COL_DESC, "grupo"],
-        as_index=False
-    )["valor"]
-    .sum()
-)
-
-g7 = resumo[resumo["grupo"] == "7"].rename(columns={"valor": "valor_g7"})
-g8 = resumo[resumo["grupo"] == "8"].rename(columns={"valor": "valor_g8"})
-
-final = pd.merge(
-    g7,
-    g8,
-    on=["mascara_normalizada", COL_DESC],
-    how="outer"
-).fillna(0)
-
-# --------------------------------------------------
-# Validação
-# --------------------------------------------------
-final["Diferença"] = final["valor_g7"] - final["valor_g8"]
-final["Status"] = final["Diferença"].apply(
-    lambda x: "CORRETO" if abs(x) < 0.01 else "DIVERGENTE"
-)
-
-# --------------------------------------------------
-# Ajuste final de colunas
-# --------------------------------------------------
-final = final.rename(columns={
-    "mascara_normalizada": "Máscara Delimitada",
-    COL_DESC: "Credor",
-    "valor_g7": "Valor - Grupo 7",
-    "valor_g8": "Valor - Grupo 8"
-})
-
-final = final[
-    [
-        "Máscara Delimitada",
-        "Credor",
-        "Valor - Grupo 7",
-        "Valor - Grupo 8",
-        "Diferença",
-        "Status"
-    ]
-]
-
-# --------------------------------------------------
-# Formatação monetária
-# --------------------------------------------------
-def formatar_moeda(col):
-    return col.apply(
-        lambda x: f"R$ {x:,.2f}"
-        .replace(",", "X")
-        .replace(".", ",")
-        .replace("X", ".")
-    )
-
-for c in ["Valor - Grupo 7", "Valor - Grupo 8", "Diferença"]:
-    final[c] = formatar_moeda(final[c])
-
-corretos = final[final["Status"] == "CORRETO"]
-divergentes = final[final["Status"] == "DIVERGENTE"]
-
-# --------------------------------------------------
-# Exibição
-# --------------------------------------------------
-st.subheader("⚠️ Credores com Divergência")
-st.dataframe(divergentes, use_container_width=True)
-
-st.subheader("✅ Credores Corretos")
-st.dataframe(corretos, use_container_width=True)
-
-# --------------------------------------------------
-# Exportação Excel
-# --------------------------------------------------
-output = BytesIO()
-with pd.ExcelWriter(output, engine="openpyxl") as writer:
-    corretos.to_excel(writer, sheet_name="Credores Corretos", index=False)
-    divergentes.to_excel(writer, sheet_name="Credores com Divergência", index=False)
-
-st.download_button(
-    "📥 Baixar resultado em Excel",
-    data=output.getvalue(),
-    file_name="validacao_credores_grupos_7_e_8.xlsx",
-    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-)
+import re
+
+import streamlit as st
+import pandas as pd
+import numpy as np
+import xlsxwriter
+from io import BytesIO
+
+# Tabela de tradução para moeda BR: "1.234,56" -> "1234.56"
+_TBL_MOEDA = str.maketrans({".": "", ",": "."})
+
+# Troca separadores no sentido inverso: "1,234.56" -> "1.234,56"
+_TBL_BR = str.maketrans({",": ".", ".": ","})
+
+# CPF (11 dígitos) ou CNPJ (14 dígitos) na descrição do credor
+_CNPJ_RE = re.compile(r"\d{11,14}", re.ASCII)
+
+# Remove acentos dos cabeçalhos (aplicado após lower(): só minúsculas)
+_FOLD = str.maketrans("áàâãäéèêëíìîïóòôõöúùûüç", "aaaaaeeeeiiiiooooouuuuc")
+
+# --------------------------------------------------
+# Mapeamento fixo de colunas (cabeçalhos já sem acento)
+# --------------------------------------------------
+COL_MASCARA = "mascara"
+COL_DESC = "descricao"
+COL_SALDO = "saldo atual"        # coluna H
+
+# --------------------------------------------------
+# Formatação monetária (apenas na exibição; o pipeline fica numérico)
+# --------------------------------------------------
+def formatar_moeda(col):
+    s = pd.Series([f"R$ {x:,.2f}" for x in col.to_numpy()], index=col.index)
+    return s.str.translate(_TBL_BR)
+
+
+# --------------------------------------------------
+# Pipeline completo CSV -> (corretos, divergentes)
+# Cacheado pelos bytes do upload: reruns do Streamlit (cliques em
+# widgets, download) não reparseiam nem reagregam o mesmo arquivo.
+# --------------------------------------------------
+def _detectar_encoding(csv_bytes):
+    """Detecta o encoding em uma amostra de 64 KB, sem reler o arquivo todo."""
+    sample = csv_bytes[:65536]
+    try:
+        sample.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as exc:
+        # Erro nos últimos bytes de uma amostra truncada é um caractere
+        # multibyte cortado ao meio, não encoding errado
+        if len(csv_bytes) > len(sample) and exc.start >= len(sample) - 4:
+            return "utf-8"
+    try:
+        import chardet
+    except ImportError:
+        return "latin1"
+    return chardet.detect(sample)["encoding"] or "latin1"
+
+
+def _ler_csv(csv_bytes, encoding):
+    """Lê o CSV com o parser pyarrow (multi-thread); cai para o parser C se
+    o pyarrow não estiver instalado."""
+    kwargs = dict(sep=";", encoding=encoding, dtype=str, na_filter=False)
+    try:
+        df = pd.read_csv(BytesIO(csv_bytes), engine="pyarrow", **kwargs)
+    except (ImportError, ValueError):
+        # pyarrow ausente, ou entrada que só o parser C tolera — ex.: linha
+        # curta de rodapé "TOTAL GERAL", que o pyarrow rejeita com
+        # ParserError/ArrowInvalid (subclasses de ValueError) e o parser C
+        # completa com NaN como o engine antigo fazia
+        return pd.read_csv(BytesIO(csv_bytes), low_memory=False, **kwargs)
+
+    # O parser pyarrow não desambigua cabeçalhos repetidos ("Tipo Saldo"
+    # aparece duas vezes no balancete); renomeia como o parser C faria:
+    # a segunda ocorrência vira "<nome>.1"
+    vistos = {}
+    colunas = []
+    for c in df.columns:
+        n = vistos.get(c, 0)
+        vistos[c] = n + 1
+        colunas.append(f"{c}.{n}" if n else c)
+    df.columns = colunas
+    return df
+
+
+@st.cache_data(show_spinner=False)
+def carregar_e_processar(csv_bytes):
+    # Leitura do CSV (TUDO como texto)
+    df = _ler_csv(csv_bytes, _detectar_encoding(csv_bytes))
+
+    # Índice tem poucas entradas: uma comprehension evita os Index
+    # intermediários das chamadas .str encadeadas
+    df.columns = [c.strip().lower().translate(_FOLD) for c in df.columns]
+
+    col_tipo = "tipo saldo.1" if "tipo saldo.1" in df.columns else "tipo saldo"  # coluna I
+
+    # Reconstrução da máscara completa
+    # (forward-fill vetorizado: linhas sem máscara herdam a última vista)
+    s = df[COL_MASCARA].astype("string").str.strip()
+    df["mascara_completa"] = s.mask(s.eq("")).ffill()
+
+    # Identificação do grupo (7 ou 8): basta o primeiro caractere da máscara,
+    # sem passar pelo motor de regex
+    primeiro = df["mascara_completa"].str[0]
+    df["grupo"] = primeiro.where(primeiro.isin(["7", "8"]))
+
+    # Filtro único e cedo: grupo 7/8 E credor com CPF/CNPJ em uma só
+    # indexação booleana; todo o trabalho abaixo roda só nas linhas que importam
+    manter = df["grupo"].notna() & df[COL_DESC].str.contains(_CNPJ_RE, na=False)
+    df = df.loc[manter].copy()
+
+    # Normalização da máscara
+    # - remove 7 ou 8
+    # - mantém até 5 níveis
+    partes = df["mascara_completa"].str.split(".", n=6)
+    df["mascara_normalizada"] = partes.str[1:6].str.join(".")
+
+    # Conversão correta do saldo atual
+    # (remove milhar e ajusta decimal em uma única passada)
+    # Guardado como centavos int64: soma e comparação exatas, metade da banda
+    saldo = pd.to_numeric(
+        df[COL_SALDO].astype(str).str.translate(_TBL_MOEDA),
+        errors="coerce"
+    ).fillna(0.0)
+    df["saldo_cents"] = np.rint(saldo.to_numpy() * 100).astype(np.int64)
+
+    # Regra de valor por grupo
+    # - Grupo 7 → somente D
+    # - Grupo 8 → somente C
+    # Uma única varredura do tipo vira códigos int8 (D=1, C=2, resto=0);
+    # daí em diante só comparações inteiras
+    t0 = df[col_tipo].astype("string").str.strip().str[:1].str.upper().to_numpy()
+    codigos = np.where(t0 == "D", 1, np.where(t0 == "C", 2, 0)).astype(np.int8)
+    grupo = df["grupo"].to_numpy()
+
+    cond = ((grupo == "7") & (codigos == 1)) | ((grupo == "8") & (codigos == 2))
+    df["valor"] = np.where(cond, df["saldo_cents"].to_numpy(), 0)
+
+    # Agrupamento
+    # (chaves como category: valores muito repetitivos → hash menor e mais rápido)
+    for c in ["mascara_normalizada", COL_DESC, "grupo"]:
+        df[c] = df[c].astype("category")
+
+    final = df.pivot_table(
+        index=["mascara_normalizada", COL_DESC],
+        columns="grupo",
+        values="valor",
+        aggfunc="sum",
+        fill_value=0,
+        observed=True,
+        sort=False
+    )
+    final = final.reindex(columns=["7", "8"], fill_value=0)
+    final.columns = ["valor_g7", "valor_g8"]
+    final = final.reset_index()
+
+    # Validação em centavos inteiros: comparação exata, sem ruído de float
+    g7c = final["valor_g7"].to_numpy()
+    g8c = final["valor_g8"].to_numpy()
+    diff_c = np.empty_like(g7c)
+    np.subtract(g7c, g8c, out=diff_c)
+    ok = diff_c == 0
+
+    # De volta a reais só para exibição/export
+    final["valor_g7"] = g7c / 100.0
+    final["valor_g8"] = g8c / 100.0
+    final["Diferença"] = diff_c / 100.0
+    final["Status"] = np.where(ok, "CORRETO", "DIVERGENTE")
+
+    # Ajuste final de colunas
+    final = final.rename(columns={
+        "mascara_normalizada": "Máscara Delimitada",
+        COL_DESC: "Credor",
+        "valor_g7": "Valor - Grupo 7",
+        "valor_g8": "Valor - Grupo 8"
+    })
+
+    final = final[
+        [
+            "Máscara Delimitada",
+            "Credor",
+            "Valor - Grupo 7",
+            "Valor - Grupo 8",
+            "Diferença",
+            "Status"
+        ]
+    ]
+
+    # Formata uma única vez no frame inteiro e fatia sem copiar
+    for c in ["Valor - Grupo 7", "Valor - Grupo 8", "Diferença"]:
+        final[c] = formatar_moeda(final[c])
+
+    # A mesma máscara booleana da validação particiona o resultado,
+    # sem reescanear a coluna Status
+    corretos = final.loc[ok]
+    divergentes = final.loc[~ok]
+
+    return corretos, divergentes
+
+
+# --------------------------------------------------
+# Exportação Excel, cacheada pelo conteúdo dos resultados:
+# reruns com o mesmo arquivo não reconstroem a planilha.
+# --------------------------------------------------
+@st.cache_data(show_spinner=False)
+def gerar_excel(corretos, divergentes):
+    output = BytesIO()
+    wb = xlsxwriter.Workbook(
+        output,
+        {"constant_memory": True, "strings_to_formulas": False}
+    )
+    for nome, frame in (
+        ("Credores Corretos", corretos),
+        ("Credores com Divergência", divergentes),
+    ):
+        ws = wb.add_worksheet(nome)
+        ws.write_row(0, 0, list(frame.columns))
+        for i, linha in enumerate(frame.itertuples(index=False, name=None), start=1):
+            ws.write_row(i, 0, linha)
+    wb.close()
+    return output.getvalue()
+
+
+# --------------------------------------------------
+# Configuração da página
+# --------------------------------------------------
+st.set_page_config(
+    page_title="Validador de Credores – PCASP",
+    layout="wide"
+)
+
+st.title("📊 Validação de Credores – Grupos 7 e 8")
+st.caption(
+    "Comparação automática entre CONTROLES DEVEDORES (Grupo 7) "
+    "e CONTROLES CREDORES (Grupo 8)."
+)
+
+# --------------------------------------------------
+# Upload
+# --------------------------------------------------
+uploaded_file = st.file_uploader(
+    "📤 Arraste e solte o arquivo CSV aqui ou clique para selecionar",
+    type=["csv"]
+)
+
+if not uploaded_file:
+    st.stop()
+
+corretos, divergentes = carregar_e_processar(uploaded_file.getvalue())
+
+# --------------------------------------------------
+# Exibição
+# --------------------------------------------------
+st.subheader("⚠️ Credores com Divergência")
+st.dataframe(divergentes, use_container_width=True)
+
+st.subheader("✅ Credores Corretos")
+st.caption(f"{len(corretos):,} credores corretos")
+st.dataframe(corretos.head(1000), use_container_width=True)
+if len(corretos) > 1000:
+    st.caption(
+        "Exibindo as 1.000 primeiras linhas — a lista completa está "
+        "no Excel para download abaixo."
+    )
+
+# --------------------------------------------------
+# Exportação Excel
+# --------------------------------------------------
+st.download_button(
+    "📥 Baixar resultado em Excel",
+    data=gerar_excel(corretos, divergentes),
+    file_name="validacao_credores_grupos_7_e_8.xlsx",
+    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+)